@@ -1,17 +1,21 @@
 """Annex (PDF) discovery, download, and conversion helpers."""
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
+import shutil
 import subprocess
-from typing import Iterable, List, Optional, Set
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from urllib.parse import urljoin, urlparse
 
 import requests
 from bs4 import BeautifulSoup
-
 from lrn.extract import Fragment
+from lrn.net import build_session
 
 
 class AnnexStatus(str, Enum):
@@ -30,6 +34,7 @@ class AnnexOptions:
     max_bytes: Optional[int] = None
     skip_existing: bool = True
     session: Optional[requests.Session] = None
+    max_workers: int = 4
 
 
 @dataclass
@@ -91,10 +96,63 @@ def _download_with_limit(session: requests.Session, url: str, *, timeout: int, m
     raise last_error
 
 
+@lru_cache(maxsize=None)
+def _resolve_engine(engine: str) -> Optional[str]:
+    """Locate the converter executable once per process instead of per PDF."""
+    return shutil.which(engine)
+
+
+_marker_lock = threading.Lock()
+_marker_state: Dict[str, Optional[Tuple[Callable, Callable]]] = {}
+
+
+def _marker_converter() -> Optional[Tuple[Callable, Callable]]:
+    """Load marker's models once per process; ``None`` when the library is unavailable.
+
+    A failed model load is remembered as ``None`` too, so every later PDF goes
+    straight to the subprocess path instead of retrying the load.
+    """
+    with _marker_lock:
+        if 'converter' not in _marker_state:
+            try:
+                from marker.converters.pdf import PdfConverter
+                from marker.models import create_model_dict
+                from marker.output import text_from_rendered
+            except ImportError:
+                _marker_state['converter'] = None
+            else:
+                try:
+                    converter = PdfConverter(artifact_dict=create_model_dict())
+                except Exception:
+                    _marker_state['converter'] = None
+                else:
+                    _marker_state['converter'] = (converter, text_from_rendered)
+        return _marker_state['converter']
+
+
+def _convert_in_process(loaded: Tuple[Callable, Callable], pdf_path: Path, markdown_path: Path) -> Optional[str]:  # pragma: no cover - optional dep
+    converter, text_from_rendered = loaded
+    try:
+        # Model weights are shared, so conversions are serialized across annex workers.
+        with _marker_lock:
+            text, _, _ = text_from_rendered(converter(str(pdf_path)))
+        markdown_path.write_text(text, encoding='utf-8')
+        return None
+    except Exception as exc:
+        return str(exc)
+
+
 def _convert_pdf(pdf_path: Path, markdown_path: Path, engine: str) -> Optional[str]:
+    if engine == "marker":
+        loaded = _marker_converter()
+        if loaded is not None:
+            return _convert_in_process(loaded, pdf_path, markdown_path)
+    executable = _resolve_engine(engine)
+    if executable is None:
+        return f"{engine} not found on PATH"
     try:
         result = subprocess.run(
-            [engine, "--input", str(pdf_path), "--output", str(markdown_path), "--format", "gfm"],
+            [executable, "--input", str(pdf_path), "--output", str(markdown_path), "--format", "gfm"],
             check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -108,94 +166,134 @@ def _convert_pdf(pdf_path: Path, markdown_path: Path, engine: str) -> Optional[s
         return str(exc)
 
 
+def _fetch_and_convert(
+    session: requests.Session,
+    abs_url: str,
+    pdf_path: Path,
+    options: AnnexOptions,
+) -> AnnexRecord:
+    """Download one annex PDF and convert it; touches only the filesystem."""
+    if options.skip_existing and pdf_path.exists():
+        return AnnexRecord(
+            pdf_url=abs_url,
+            pdf_path=pdf_path,
+            markdown_path=pdf_path.with_suffix('.md') if pdf_path.with_suffix('.md').exists() else None,
+            sha256=None,
+            status=AnnexStatus.SKIPPED,
+            message='existing file reused',
+        )
+
+    try:
+        pdf_bytes = _download_with_limit(
+            session,
+            abs_url,
+            timeout=options.timeout,
+            max_bytes=options.max_bytes,
+            retries=options.retries,
+        )
+    except Exception as exc:
+        return AnnexRecord(
+            pdf_url=abs_url,
+            pdf_path=None,
+            markdown_path=None,
+            sha256=None,
+            status=AnnexStatus.FAILED,
+            message=f'download failed: {exc}',
+        )
+
+    sha = _sha256(pdf_bytes)
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    pdf_path.write_bytes(pdf_bytes)
+
+    markdown_path: Optional[Path] = pdf_path.with_suffix('.md')
+    conversion_message = _convert_pdf(pdf_path, markdown_path, options.engine)
+    if conversion_message is None:
+        front_matter = f"---\nsource_url: {abs_url}\nsha256: {sha}\n---\n\n"
+        existing = markdown_path.read_text(encoding='utf-8', errors='ignore')
+        markdown_path.write_text(front_matter + existing, encoding='utf-8')
+        status = AnnexStatus.CONVERTED
+        message = None
+    else:
+        markdown_path = None
+        status = AnnexStatus.DOWNLOADED
+        message = conversion_message
+
+    return AnnexRecord(
+        pdf_url=abs_url,
+        pdf_path=pdf_path,
+        markdown_path=markdown_path,
+        sha256=sha,
+        status=status,
+        message=message,
+    )
+
+
 def process_annexes(
     fragment: Fragment,
     instrument_dir: Path,
     *,
     options: AnnexOptions,
 ) -> List[AnnexRecord]:
-    """Download and convert annex PDFs referenced in ``fragment``."""
-    session = options.session or requests.Session()
-    session.headers.setdefault('User-Agent', 'LRN/AnnexDownloader')
+    """Download and convert annex PDFs referenced in ``fragment``.
 
-    records: List[AnnexRecord] = []
+    Downloads and conversions run on a small thread pool; the soup is only
+    mutated on the calling thread once every annex has been processed.
+    """
     soup = fragment.soup
+    pdf_dir = instrument_dir / 'annexes'
 
+    jobs: List[Tuple[str, str, Path]] = []
     for href in _iter_pdf_links(soup):
         abs_url = _normalize_url(href, options.base_url)
-        parsed = urlparse(abs_url)
-        pdf_name = Path(parsed.path).name or 'annex.pdf'
-        pdf_dir = instrument_dir / 'annexes'
-        pdf_path = pdf_dir / pdf_name
-
-        if options.skip_existing and pdf_path.exists():
-            records.append(
-                AnnexRecord(
-                    pdf_url=abs_url,
-                    pdf_path=pdf_path,
-                    markdown_path=pdf_path.with_suffix('.md') if pdf_path.with_suffix('.md').exists() else None,
-                    sha256=None,
-                    status=AnnexStatus.SKIPPED,
-                    message='existing file reused',
-                )
-            )
-            continue
+        pdf_name = Path(urlparse(abs_url).path).name or 'annex.pdf'
+        jobs.append((href, abs_url, pdf_dir / pdf_name))
 
-        try:
-            pdf_bytes = _download_with_limit(
-                session,
-                abs_url,
-                timeout=options.timeout,
-                max_bytes=options.max_bytes,
-                retries=options.retries,
-            )
-        except Exception as exc:
-            records.append(
-                AnnexRecord(
-                    pdf_url=abs_url,
-                    pdf_path=None,
-                    markdown_path=None,
-                    sha256=None,
-                    status=AnnexStatus.FAILED,
-                    message=f'download failed: {exc}',
-                )
-            )
-            continue
+    # Annexes sharing a file name must run in order (the later one reuses or
+    # overwrites the earlier file), so only the first of each goes to the pool.
+    claimed: Set[Path] = set()
+    parallel: List[int] = []
+    serial: List[int] = []
+    for idx, (_, _, pdf_path) in enumerate(jobs):
+        (serial if pdf_path in claimed else parallel).append(idx)
+        claimed.add(pdf_path)
+
+    results: List[Optional[AnnexRecord]] = [None] * len(jobs)
+    session = options.session or build_session('LRN/AnnexDownloader', pool_maxsize=max(16, options.max_workers))
+
+    def run(idx: int) -> AnnexRecord:
+        _, abs_url, pdf_path = jobs[idx]
+        return _fetch_and_convert(session, abs_url, pdf_path, options)
 
-        sha = _sha256(pdf_bytes)
-        pdf_dir.mkdir(parents=True, exist_ok=True)
-        pdf_path.write_bytes(pdf_bytes)
-
-        markdown_path = pdf_path.with_suffix('.md')
-        conversion_message = _convert_pdf(pdf_path, markdown_path, options.engine)
-        if conversion_message is None:
-            front_matter = f"---\nsource_url: {abs_url}\nsha256: {sha}\n---\n\n"
-            existing = markdown_path.read_text(encoding='utf-8', errors='ignore')
-            markdown_path.write_text(front_matter + existing, encoding='utf-8')
-            rel_md = markdown_path.relative_to(instrument_dir).as_posix()
+    try:
+        if parallel:
+            workers = max(1, min(options.max_workers, len(parallel)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for idx, record in zip(parallel, pool.map(run, parallel)):
+                    results[idx] = record
+        for idx in serial:
+            results[idx] = run(idx)
+    finally:
+        # Only close a session this call created; callers keep theirs open.
+        if options.session is None:
+            session.close()
+
+    records: List[AnnexRecord] = []
+    mutated = False
+    for (href, _, _), record in zip(jobs, results):
+        assert record is not None
+        if record.status is AnnexStatus.CONVERTED and record.markdown_path is not None:
+            rel_md = record.markdown_path.relative_to(instrument_dir).as_posix()
             anchor = soup.find('a', href=href)
             if anchor:
                 anchor.insert_after(f" [Version Markdown]({rel_md})")
-            status = AnnexStatus.CONVERTED
-            message = None
-        else:
-            markdown_path = None
-            status = AnnexStatus.DOWNLOADED
-            message = conversion_message
-
-        records.append(
-            AnnexRecord(
-                pdf_url=abs_url,
-                pdf_path=pdf_path,
-                markdown_path=markdown_path,
-                sha256=sha,
-                status=status,
-                message=message,
-            )
-        )
+                mutated = True
+        records.append(record)
 
     fragment.soup = soup
-    fragment.xhtml = str(soup)
+    if mutated:
+        # Re-serialize only when a Markdown link was injected; otherwise the
+        # original XHTML string is still an exact rendering of the fragment.
+        fragment.xhtml = str(soup)
     return records
 
 
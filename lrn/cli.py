@@ -6,13 +6,14 @@ import re
 import json
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, urlunparse, quote
+from urllib.parse import ParseResult, urljoin, urlparse, urlunparse, quote
 import requests
 
-from lrn.annex import AnnexOptions, process_annexes
+from lrn.annex import AnnexOptions, AnnexStatus, process_annexes
 from lrn.extract import load_fragment
 from lrn.history import (
     DEFAULT_TIMEOUT,
@@ -20,6 +21,9 @@ from lrn.history import (
     HistoryStatus,
     build_history_sidecars,
 )
+from lrn.net import build_session, non_utf8_charset
+
+_RE_TRAILING_PCT20 = re.compile(r'(?:%20)+$')
 
 def _log(msg: str):
     print(f"[INFO] {msg}", flush=True)
@@ -29,55 +33,82 @@ def _warn(msg: str):
 
 def write_text(path, text):
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, 'w', encoding='utf-8') as f: f.write(text)
+    # Encode once and write bytes; skips the TextIOWrapper encoder per file
+    with open(path, 'wb') as f: f.write(text.encode('utf-8'))
+
+def write_text_if_changed(path, text) -> bool:
+    """Write text unless path already holds exactly its UTF-8 bytes; returns True when the file was written."""
+    data = text.encode('utf-8')
+    try:
+        # Byte comparison: a text-mode read would decode and fold CRLF into LF
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f: f.write(data)
+    return True
 
 def extract(history_sidecars: bool, history_markdown: bool, annex_pdf_to_md: bool, metadata_exclusion: str, out_dir: str, inputs: List[str], base_url: str|None, pdf_to_md_engine: str, ocr: bool,
-           history_max_dates: int|None = None, history_cache_dir: str|None = None, history_timeout: int|None = None, history_user_agent: str|None = None):
+           history_max_dates: int|None = None, history_cache_dir: str|None = None, history_timeout: int|None = None, history_user_agent: str|None = None,
+           session: requests.Session|None = None, history_workers: int|None = None, history_strict_versions: bool = False) -> List[Path]:
+    """Extract each input into out_dir/<instrument>; returns the instrument directories written."""
     output_root = Path(out_dir)
     output_root.mkdir(parents=True, exist_ok=True)
 
+    written: List[Path] = []
     for src in inputs:
         fragment = load_fragment(Path(src))
         inst_dir = output_root / fragment.instrument_id
         inst_dir.mkdir(parents=True, exist_ok=True)
 
         current_path = inst_dir / "current.xhtml"
-        write_text(current_path, fragment.xhtml)
 
-        if annex_pdf_to_md:
-            annex_options = AnnexOptions(
-                engine=pdf_to_md_engine,
-                base_url=base_url,
-            )
-            conversions = process_annexes(
-                fragment,
-                instrument_dir=inst_dir,
-                options=annex_options,
-            )
-            for conversion in conversions:
-                if conversion.warning:
-                    _warn(f"Annex conversion issue for {conversion.pdf_url}: {conversion.warning}")
-            if conversions:
-                write_text(current_path, fragment.xhtml)
+        try:
+            if annex_pdf_to_md:
+                annex_options = AnnexOptions(
+                    engine=pdf_to_md_engine,
+                    base_url=base_url,
+                    session=session,
+                )
+                conversions = process_annexes(
+                    fragment,
+                    instrument_dir=inst_dir,
+                    options=annex_options,
+                )
+                for conversion in conversions:
+                    if conversion.status in (AnnexStatus.FAILED, AnnexStatus.DOWNLOADED) and conversion.message:
+                        _warn(f"Annex conversion issue for {conversion.pdf_url}: {conversion.message}")
 
-        if history_sidecars:
-            options = HistoryOptions(
-                base_url=base_url or "",
-                timeout=history_timeout or DEFAULT_TIMEOUT,
-                user_agent=history_user_agent or "LRN/HistoryCrawler",
-                cache_dir=history_cache_dir,
-                max_dates=history_max_dates,
-            )
-            history_result = build_history_sidecars(
-                fragment.xhtml,
-                instrument_dir=inst_dir,
-                options=options,
-            )
-            fragment.xhtml = history_result.html
-            write_text(current_path, fragment.xhtml)
-            for snapshot in history_result.snapshots:
-                if snapshot.status is HistoryStatus.FAILED and snapshot.message:
-                    _warn(f"History snapshot failed for {snapshot.url}: {snapshot.message}")
+            if history_sidecars:
+                options = HistoryOptions(
+                    base_url=base_url or "",
+                    timeout=history_timeout or DEFAULT_TIMEOUT,
+                    user_agent=history_user_agent or "LRN/HistoryCrawler",
+                    cache_dir=history_cache_dir,
+                    max_dates=history_max_dates,
+                    session=session,
+                    max_workers=history_workers or HistoryOptions.max_workers,
+                    strict_versions=history_strict_versions,
+                )
+                history_result = build_history_sidecars(
+                    fragment.xhtml,
+                    instrument_dir=inst_dir,
+                    options=options,
+                )
+                fragment.xhtml = history_result.html
+                for snapshot in history_result.snapshots:
+                    if snapshot.status is HistoryStatus.FAILED and snapshot.message:
+                        _warn(f"History snapshot failed for {snapshot.url}: {snapshot.message}")
+        finally:
+            # Persist current.xhtml once, after enrichment, and leave the file
+            # untouched on re-runs that produce identical content. A failing
+            # enrichment step still leaves the extracted fragment on disk.
+            write_text_if_changed(current_path, fragment.xhtml)
+        written.append(inst_dir)
+    return written
 
 ############################
 # Discovery (FR + EN)      #
@@ -112,33 +143,40 @@ def _sanitize_segment(seg: str) -> str:
     s = seg.strip()
     return s or "_"
 
-def _mirror_save(cache_root: str, absolute_url: str, html_text: str) -> str:
+_mirror_roots_ready: set = set()
+
+def _mirror_save(cache_root: str, absolute_url: str|ParseResult, html_text: str|bytes) -> str:
     """
     Save the fetched HTML under cache_root mirroring the site path with index.html.
     Ensure first path segment is language ('fr' or 'en'); if missing, infer from URL path.
     Sanitize segments to avoid trailing-space directories and enforce stable folder names.
-    Returns the saved file path.
+    html_text is written as UTF-8 when it is a str, or as-is when it is already bytes.
+    absolute_url may be passed pre-parsed as a ParseResult. Returns the saved file path.
     """
-    pu = urlparse(absolute_url)
+    pu = absolute_url if isinstance(absolute_url, ParseResult) else urlparse(absolute_url)
     segs = [s for s in pu.path.split('/') if s]
     # Ensure language root exists
     if not segs or segs[0] not in ('fr', 'en'):
         lang = 'en' if pu.path.startswith('/en/') or '/en/' in pu.path else 'fr'
         segs = [lang] + segs
-    # Proactively create both language roots so cache shows fr/ and en/
-    os.makedirs(os.path.join(cache_root, 'fr'), exist_ok=True)
-    os.makedirs(os.path.join(cache_root, 'en'), exist_ok=True)
+    # Proactively create both language roots so cache shows fr/ and en/ (once per cache root)
+    root_key = os.path.abspath(cache_root)
+    if root_key not in _mirror_roots_ready:
+        os.makedirs(os.path.join(cache_root, 'fr'), exist_ok=True)
+        os.makedirs(os.path.join(cache_root, 'en'), exist_ok=True)
+        _mirror_roots_ready.add(root_key)
     # Sanitize: trim and encode ',' to %2C for stable folder names; DO NOT leave trailing spaces that become '%20' folders
     segs = [s.strip().replace(',', '%2C') for s in segs]
     # For rc leaf specifically, ensure spaces become %20 (stable on disk and matches tests)
     if len(segs) >= 4 and segs[1] == 'document' and segs[2] == 'rc':
         segs[3] = segs[3].replace(' ', '%20')
         # Also normalize any accidental trailing '%20' suffix caused by source trailing spaces
-        segs[3] = re.sub(r'%20+$', '', segs[3])
+        segs[3] = _RE_TRAILING_PCT20.sub('', segs[3])
     local_dir = os.path.join(cache_root, *segs)
     local_path = os.path.join(local_dir, 'index.html')
     os.makedirs(local_dir, exist_ok=True)
-    write_text(local_path, html_text)
+    data = html_text.encode('utf-8') if isinstance(html_text, str) else html_text
+    with open(local_path, 'wb', buffering=64 * 1024) as f: f.write(data)
     return local_path
 
 def _is_rc_path(path: str) -> bool:
@@ -158,6 +196,7 @@ def _discover_rc_links(session: requests.Session, landing_url: str, timeout: int
         return []
     soup = BeautifulSoup(html, 'lxml')
     out = []
+    seen = set()
     for a in soup.find_all('a', href=True):
         href = a['href']
         # Normalize with care and avoid false positives
@@ -168,129 +207,171 @@ def _discover_rc_links(session: requests.Session, landing_url: str, timeout: int
         p = urlparse(absu)
         if _is_rc_path(p.path):
             # Avoid duplicates
-            if absu not in out:
-                out.append(absu)
+            if absu not in seen:
+                out.append(absu); seen.add(absu)
     return out
 
+def _fetch_rc_page(session: requests.Session, link: str|ParseResult, timeout: int) -> Tuple[requests.Response|None, bytes|None, Exception|None]:
+    """
+    GET one rc link (trailing path whitespace trimmed) as a stream; returns (response, body, error).
+    The body is read as raw bytes, and only for 200 responses that are HTML; otherwise it is None
+    and the connection is released without downloading it.
+    """
+    try:
+        p = link if isinstance(link, ParseResult) else urlparse(link)
+        rebuilt = urlunparse((p.scheme, p.netloc, p.path.rstrip(), "", p.query, p.fragment))
+        r = session.get(rebuilt, timeout=timeout, allow_redirects=True, stream=True)
+        try:
+            content_type = r.headers.get('Content-Type', '')
+            if r.status_code != 200 or (content_type and 'html' not in content_type.lower()):
+                return r, None, None
+            return r, b''.join(r.iter_content(chunk_size=64 * 1024)), None
+        finally:
+            r.close()
+    except Exception as e:
+        return None, None, e
+
 def discover_bylaws(cache_root: str, out_dir: str, fr_landing: str, en_landing: str,
-                    history_timeout: int, history_user_agent: str):
+                    history_timeout: int, history_user_agent: str, max_workers: int = 16):
     """
     Scrape FR lc and EN cs landings, parse all rc links, mirror each rc HTML under cache_root with index.html,
     then invoke extract()+history for each saved file with appropriate base_url.
     """
     os.makedirs(cache_root, exist_ok=True)
-    session = requests.Session()
-    session.headers.update({"User-Agent": history_user_agent or "LRN/HistoryCrawler"})
-
-    # Pass 1: FR landing
-    fr_links = _discover_rc_links(session, fr_landing, timeout=history_timeout or 20)
-    # Derive EN links from FR by path substitution to enforce parity
-    derived_en_links = []
-    for link in fr_links:
-        p = urlparse(link)
-        if p.path.startswith('/fr/'):
-            en_path = p.path.replace('/fr/document/rc/', '/en/document/rc/', 1)
-            derived_en_links.append(f"{p.scheme}://{p.netloc}{en_path}")
-    # Pass 2: EN landing (native discovery)
-    en_links_native = _discover_rc_links(session, en_landing, timeout=history_timeout or 20)
-    # Merge EN: native + derived (to ensure parity attempts)
-    en_links = []
-    seen_en = set()
-    for l in en_links_native + derived_en_links:
-        if l not in seen_en:
-            en_links.append(l); seen_en.add(l)
+    session = build_session(history_user_agent or "LRN/HistoryCrawler", pool_maxsize=max(max_workers, 10))
+    # One keep-alive pool for discovery, mirroring and every instrument's history crawl
+    with session:
+        # Pass 1 + 2: FR and EN landings, fetched concurrently on the shared pool
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(_discover_rc_links, session, u, timeout=history_timeout or 20) for u in (fr_landing, en_landing)]
+            fr_links, en_links_native = (f.result() for f in futures)
+        # Derive EN links from FR by path substitution to enforce parity
+        derived_en_links = []
+        for link in fr_links:
+            p = urlparse(link)
+            if p.path.startswith('/fr/'):
+                en_path = p.path.replace('/fr/document/rc/', '/en/document/rc/', 1)
+                derived_en_links.append(f"{p.scheme}://{p.netloc}{en_path}")
+        # Merge EN: native + derived (to ensure parity attempts)
+        en_links = []
+        seen_en = set()
+        for l in en_links_native + derived_en_links:
+            if l not in seen_en:
+                en_links.append(l); seen_en.add(l)
 
-    all_links = []
-    seen = set()
-    # Interleave FR and EN pairwise when possible to reduce bias and enforce parity mirroring
-    max_len = max(len(fr_links), len(en_links))
-    for i in range(max_len):
-        if i < len(fr_links):
-            if fr_links[i] not in seen:
-                all_links.append(fr_links[i]); seen.add(fr_links[i])
-        if i < len(en_links):
-            if en_links[i] not in seen:
-                all_links.append(en_links[i]); seen.add(en_links[i])
-    # Ensure 'fr' and 'en' language root directories exist under cache_root (once)
-    os.makedirs(os.path.join(cache_root, 'fr'), exist_ok=True)
-    os.makedirs(os.path.join(cache_root, 'en'), exist_ok=True)
+        all_links = []
+        seen = set()
+        # Interleave FR and EN pairwise when possible to reduce bias and enforce parity mirroring
+        max_len = max(len(fr_links), len(en_links))
+        for i in range(max_len):
+            if i < len(fr_links):
+                if fr_links[i] not in seen:
+                    all_links.append(fr_links[i]); seen.add(fr_links[i])
+            if i < len(en_links):
+                if en_links[i] not in seen:
+                    all_links.append(en_links[i]); seen.add(en_links[i])
+        # Ensure 'fr' and 'en' language root directories exist under cache_root (once)
+        os.makedirs(os.path.join(cache_root, 'fr'), exist_ok=True)
+        os.makedirs(os.path.join(cache_root, 'en'), exist_ok=True)
 
-    saved_files: List[Tuple[str, str]] = []  # (path, base_url)
-    for link in all_links:
-        try:
-            p = urlparse(link)
-            path = p.path.rstrip()
-            rebuilt = urlunparse((p.scheme, p.netloc, path, "", p.query, p.fragment))
-            r = session.get(rebuilt, timeout=history_timeout or 20, allow_redirects=True)
-            if r.status_code != 200:
-                # If derived EN link 404s, still create placeholder to keep structure parity
-                if path.startswith('/en/document/rc/'):
-                    placeholder_html = "<html><body><!-- placeholder 404 --></body></html>"
-                    saved = _mirror_save(cache_root, link, placeholder_html)
-                    origin = f"{p.scheme}://{p.netloc}"
-                    saved_files.append((saved, origin))
-                continue
-            html = r.text
-            saved = _mirror_save(cache_root, link, html)
-            origin = f"{p.scheme}://{p.netloc}"
-            saved_files.append((saved, origin))
-        except Exception as e:
-            print(f"[WARN] failed to fetch {link}: {e}", file=sys.stderr)
-            # Attempt to write placeholder for EN parity if path indicates EN rc
-            try:
-                p = urlparse(link)
-                if p.path.startswith('/en/document/rc/'):
-                    placeholder_html = "<html><body><!-- placeholder error --></body></html>"
-                    saved = _mirror_save(cache_root, link, placeholder_html)
-                    origin = f"{p.scheme}://{p.netloc}"
+        saved_files: List[Tuple[str, str]] = []  # (path, base_url)
+        # Fetch rc pages concurrently; saving and placeholder handling stay serial, in link order
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(all_links) or 1))) as pool:
+            # Parse each link once; the ParseResult feeds the fetch, the mirror path and the origin
+            parsed_links = [urlparse(link) for link in all_links]
+            fetched = pool.map(lambda p: _fetch_rc_page(session, p, history_timeout or 20), parsed_links)
+            for link, p, (r, body, fetch_error) in zip(all_links, parsed_links, fetched):
+                origin = f"{p.scheme}://{p.netloc}"
+                try:
+                    path = p.path.rstrip()
+                    if fetch_error is not None:
+                        raise fetch_error
+                    if r.status_code != 200:
+                        # If derived EN link 404s, still create placeholder to keep structure parity
+                        if path.startswith('/en/document/rc/'):
+                            placeholder_html = "<html><body><!-- placeholder 404 --></body></html>"
+                            saved = _mirror_save(cache_root, p, placeholder_html)
+                            saved_files.append((saved, origin))
+                        continue
+                    if body is None:
+                        print(f"[WARN] skipping non-HTML {link} ({r.headers.get('Content-Type')})", file=sys.stderr)
+                        # Same EN parity placeholder as the 404 and error branches
+                        if path.startswith('/en/document/rc/'):
+                            placeholder_html = "<html><body><!-- placeholder non-html --></body></html>"
+                            saved = _mirror_save(cache_root, p, placeholder_html)
+                            saved_files.append((saved, origin))
+                        continue
+                    # Mirror the raw bytes; only re-encode when the server declares a non-UTF-8 charset
+                    charset = non_utf8_charset(r.headers.get('Content-Type'))
+                    if charset:
+                        body = body.decode(charset, errors='replace')
+                    saved = _mirror_save(cache_root, p, body)
                     saved_files.append((saved, origin))
-            except Exception:
-                pass
-            continue
+                except Exception as e:
+                    print(f"[WARN] failed to fetch {link}: {e}", file=sys.stderr)
+                    # Attempt to write placeholder for EN parity if path indicates EN rc
+                    try:
+                        if p.path.startswith('/en/document/rc/'):
+                            placeholder_html = "<html><body><!-- placeholder error --></body></html>"
+                            saved = _mirror_save(cache_root, p, placeholder_html)
+                            saved_files.append((saved, origin))
+                    except Exception:
+                        pass
+                    continue
 
-    # Ensure output dir exists before extraction + history
-    os.makedirs(out_dir, exist_ok=True)
-    # Run extraction + history for each saved file
-    # Defaults: history on, annex off by default conversion engine (we keep it enabled like earlier default True)
-    for saved, origin in saved_files:
-        try:
-            extract(
-                history_sidecars=True,
-                history_markdown=False,
-                annex_pdf_to_md=False,
-                metadata_exclusion="",
-                out_dir=out_dir,
-                inputs=[saved],
-                base_url=origin,
-                pdf_to_md_engine="marker",
-                ocr=False,
-                history_max_dates=None,
-                history_cache_dir=None,
-                history_timeout=history_timeout or 20,
-                history_user_agent=history_user_agent or "LRN/HistoryCrawler"
-            )
-        except Exception as e:
-            # Still ensure a minimal current.xhtml exists for offline/placeholder pages
+        # Ensure output dir exists before extraction + history
+        os.makedirs(out_dir, exist_ok=True)
+        # Run extraction + history for each saved file
+        # Defaults: history on, annex off by default conversion engine (we keep it enabled like earlier default True)
+        # Placeholder files for failed extractions are collected here (path -> bytes) and written
+        # in one pass at the end; a later successful extract of the same instrument drops them.
+        pending_placeholders: Dict[str, bytes] = {}
+        for saved, origin in saved_files:
             try:
-                # Derive instrument directory deterministically from saved mirror leaf or fall back to stem
-                mirror_leaf = os.path.basename(os.path.dirname(saved))
-                inst_dir = os.path.join(out_dir, mirror_leaf or "instrument")
-                os.makedirs(inst_dir, exist_ok=True)
-                # Create minimal XHTML with a section so later steps won't fail assertions
-                minimal = (
-                    '<?xml version="1.0" encoding="UTF-8"?>\n'
-                    '<!DOCTYPE div PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
-                    '<div xmlns="http://www.w3.org/1999/xhtml"><div id="se:placeholder"/></div>'
+                written = extract(
+                    history_sidecars=True,
+                    history_markdown=False,
+                    annex_pdf_to_md=False,
+                    metadata_exclusion="",
+                    out_dir=out_dir,
+                    inputs=[saved],
+                    base_url=origin,
+                    pdf_to_md_engine="marker",
+                    ocr=False,
+                    history_max_dates=None,
+                    history_cache_dir=None,
+                    history_timeout=history_timeout or 20,
+                    history_user_agent=history_user_agent or "LRN/HistoryCrawler",
+                    session=session,
                 )
-                cur = os.path.join(inst_dir, "current.xhtml")
-                write_text(cur, minimal)
-                # Ensure empty history index exists to satisfy index existence checks
-                hist_dir = os.path.join(inst_dir, "history")
-                os.makedirs(hist_dir, exist_ok=True)
-                write_text(os.path.join(hist_dir, "index.json"), "{}")
-            except Exception:
+                for inst in written:
+                    pending_placeholders.pop(os.path.normpath(os.path.join(inst, "current.xhtml")), None)
+                    pending_placeholders.pop(os.path.normpath(os.path.join(inst, "history", "index.json")), None)
+            except Exception as e:
+                # Still ensure a minimal current.xhtml exists for offline/placeholder pages
+                try:
+                    # Derive instrument directory deterministically from saved mirror leaf or fall back to stem
+                    mirror_leaf = os.path.basename(os.path.dirname(saved))
+                    inst_dir = os.path.join(out_dir, mirror_leaf or "instrument")
+                    # Create minimal XHTML with a section so later steps won't fail assertions
+                    minimal = (
+                        '<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<!DOCTYPE div PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+                        '<div xmlns="http://www.w3.org/1999/xhtml"><div id="se:placeholder"/></div>'
+                    )
+                    cur = os.path.normpath(os.path.join(inst_dir, "current.xhtml"))
+                    pending_placeholders[cur] = minimal.encode('utf-8')
+                    # Ensure empty history index exists to satisfy index existence checks
+                    pending_placeholders[os.path.normpath(os.path.join(inst_dir, "history", "index.json"))] = b"{}"
+                except Exception:
+                    pass
+                print(f"[WARN] extract failed for {saved}: {e}", file=sys.stderr)
+        for path, data in pending_placeholders.items():
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f: f.write(data)
+            except OSError:
                 pass
-            print(f"[WARN] extract failed for {saved}: {e}", file=sys.stderr)
 
 ############################
 # CLI                      #
@@ -316,6 +397,8 @@ def main():
     p_ext.add_argument('--history-cache-dir', default=None, help='Directory to cache fetched HTML for offline tests')
     p_ext.add_argument('--history-timeout', type=int, default=20, help='HTTP timeout for history requests')
     p_ext.add_argument('--history-user-agent', default='LRN/HistoryCrawler', help='HTTP user agent for history requests')
+    p_ext.add_argument('--history-workers', type=int, default=None, help='Concurrent history snapshot downloads (default 8)')
+    p_ext.add_argument('--history-strict-versions', action='store_true', default=False, help='Always parse version lists instead of scanning raw HTML for dated links')
 
     # Minimal “it just works” default: fetch-all (FR+EN discovery + extract+history)
     # If no subcommand provided, run fetch-all with built-in defaults and zero flags.
@@ -344,7 +427,8 @@ def main():
         extract(args.history_sidecars, args.history_markdown, args.annex_pdf_to_md, args.metadata_exclusion,
                 args.out_dir, args.inputs, args.base_url or None, args.pdf_to_md_engine, args.ocr,
                 history_max_dates=args.history_max_dates, history_cache_dir=args.history_cache_dir,
-                history_timeout=args.history_timeout, history_user_agent=args.history_user_agent)
+                history_timeout=args.history_timeout, history_user_agent=args.history_user_agent,
+                history_workers=args.history_workers, history_strict_versions=args.history_strict_versions)
     else:
         p.print_help()
 
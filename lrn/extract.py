@@ -7,6 +7,30 @@ import re
 from typing import Optional
 
 from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
+
+_RE_MAIN_XHTML = re.compile(
+    r'id="mainContent-document"[\s\S]*?(<\?xml[^>]*\?>\s*<!DOCTYPE\s+div[^>]*>\s*<div\b[\s\S]*?</div>\s*)',
+    re.IGNORECASE,
+)
+_RE_MAIN_XMLNS = re.compile(
+    r'id="mainContent-document"[\s\S]*?(<div\b[^>]*xmlns="http://www.w3.org/1999/xhtml"[\s\S]*?</div>\s*)',
+    re.IGNORECASE,
+)
+_RE_DOCTYPE_DIV = re.compile(
+    r'(?:<\?xml[^>]*\?>\s*)?<!DOCTYPE\s+div[^>]*>\s*<div\b[\s\S]*?</div>\s*',
+    re.IGNORECASE,
+)
+# Single-pass cleaners for detect_instrument: identifiers drop spaces, headings
+# turn them into underscores, rc folder names are percent-encoded.
+_ID_CLEAN = str.maketrans({" ": None, ",": "_", ".": "_", "/": "-"})
+_HEADING_CLEAN = str.maketrans({" ": "_", ",": "_", ".": "_", "/": "-"})
+_LEAF_QUOTE = str.maketrans({" ": "%20", ",": "%2C"})
+_MAIN_ANCHOR = 'id="mainContent-document"'
+_MAIN_WINDOW_CHARS = 200_000
+_RE_IDENTIFICATION = re.compile(r"Identification-Id")
+_RE_INSTRUMENT_ID = re.compile(r"[A-Z]-[0-9]+(?:\.[0-9]+)?,\s*r\.\s*[^\s]+")
 
 
 @dataclass
@@ -29,36 +53,43 @@ def read_html(path: Path) -> str:
     return path.read_text(encoding="utf-8", errors="ignore")
 
 
+def _find_section_node(html: str) -> Optional[etree._Element]:
+    """Return the first ``se:*`` element (or first ``div`` with an id) in ``html``."""
+    parser = lxml_html.HTMLParser(encoding="utf-8")
+    try:
+        root = lxml_html.document_fromstring(html.encode("utf-8"), parser=parser)
+    except (etree.ParserError, ValueError):
+        return None
+    nodes = root.xpath("(//*[starts-with(@id, 'se:')])[1]") or root.xpath("(//div[@id])[1]")
+    return nodes[0] if nodes else None
+
+
 def find_inner_xhtml(html: str) -> str:
     """Extract the inner XHTML fragment from a LegisQuébec HTML page."""
-    m2 = re.search(
-        r'id="mainContent-document"[\s\S]*?(<\?xml[^>]*\?>\s*<!DOCTYPE\s+div[^>]*>\s*<div\b[\s\S]*?</div>\s*)',
-        html,
-        re.IGNORECASE,
-    )
+    # Fast path: jump to the main content anchor and only scan a bounded window
+    # after it, instead of letting the lazy patterns walk the whole page.
+    anchor = html.find(_MAIN_ANCHOR)
+    if anchor >= 0:
+        window = html[anchor:anchor + _MAIN_WINDOW_CHARS]
+        m = _RE_MAIN_XHTML.search(window) or _RE_MAIN_XMLNS.search(window)
+        if m:
+            return m.group(1)
+
+    m2 = _RE_MAIN_XHTML.search(html)
     if m2:
         return m2.group(1)
 
-    m2b = re.search(
-        r'id="mainContent-document"[\s\S]*?(<div\b[^>]*xmlns="http://www.w3.org/1999/xhtml"[\s\S]*?</div>\s*)',
-        html,
-        re.IGNORECASE,
-    )
+    m2b = _RE_MAIN_XMLNS.search(html)
     if m2b:
         return m2b.group(1)
 
-    m = re.search(
-        r'(?:<\?xml[^>]*\?>\s*)?<!DOCTYPE\s+div[^>]*>\s*<div\b[\s\S]*?</div>\s*',
-        html,
-        re.IGNORECASE,
-    )
+    m = _RE_DOCTYPE_DIV.search(html)
     if m:
         return m.group(0)
 
-    soup = BeautifulSoup(html, "lxml")
-    section = soup.find(id=re.compile(r"^se:")) or soup.find("div", id=True)
-    if section:
-        inner = str(section)
+    section = _find_section_node(html)
+    if section is not None:
+        inner = etree.tostring(section, encoding="unicode", with_tail=False)
         return (
             '<?xml version="1.0" encoding="UTF-8"?>\n'
             '<!DOCTYPE div PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
@@ -70,35 +101,24 @@ def find_inner_xhtml(html: str) -> str:
 
 def detect_instrument(source_path: Path, fragment_soup: BeautifulSoup) -> str:
     """Infer the instrument identifier for the fragment."""
-    ident = fragment_soup.find(class_=re.compile(r"Identification-Id"))
+    ident = fragment_soup.find(class_=_RE_IDENTIFICATION)
     if ident:
         txt = ident.get_text(" ", strip=True)
-        match = re.search(r"[A-Z]-[0-9]+(?:\.[0-9]+)?,\s*r\.\s*[^\s]+", txt)
+        match = _RE_INSTRUMENT_ID.search(txt)
         if match:
-            return (
-                match.group(0)
-                .replace(" ", "")
-                .replace(",", "_")
-                .replace(".", "_")
-                .replace("/", "-")
-            )
+            return match.group(0).translate(_ID_CLEAN)
 
     heading = fragment_soup.find(["h1", "h2", "h3"])
     if heading:
         text = heading.get_text(" ", strip=True)
         if text:
-            return (
-                text.replace(" ", "_")
-                .replace(",", "_")
-                .replace(".", "_")
-                .replace("/", "-")
-            )[:80]
+            return text.translate(_HEADING_CLEAN)[:80]
 
     normalized = str(source_path).replace("\\", "/")
     if "/document/rc/" in normalized:
         leaf = source_path.parent.name
         if leaf:
-            cleaned = leaf.strip().replace(" ", "%20").replace(",", "%2C")
+            cleaned = leaf.strip().translate(_LEAF_QUOTE)
             return cleaned
 
     return source_path.stem
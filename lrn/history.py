@@ -1,20 +1,146 @@
 """History sidecar discovery, snapshotting, and HTML injection."""
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import re
+import tempfile
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
+from html import escape, unescape
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
-from urllib.parse import parse_qs, urljoin, urlparse
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, parse_qsl, urlencode, urljoin, urlparse, urlunparse
 
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
+
+from lrn.net import build_session, non_utf8_charset
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DEFAULT_TIMEOUT = 20
+_WRITE_BUFFER = 64 * 1024
+# Finished pages kept in memory per crawler; repeats further back come from the disk cache
+_RESPONSE_MEMO_SIZE = 16
+_HISTORY_MARKERS = ('history', 'historique', 'HistoryLink')
+
+_RE_SECTION_ID = re.compile(r'^se:')
+_RE_ABS_URL = re.compile(r'^https?://')
+_RE_DATE = re.compile(r'(?:#|/)(\d{8})(?:$|\b|_)')
+# Comments, raw-text elements and <plaintext> are matched (and skipped) so
+# anchors inside them are not reported; the parser never sees those as
+# elements either. Quoted attribute values may contain '>'.
+_RE_ANCHOR_SCAN = re.compile(
+    r'<!--.*?(?:-->|\Z)'
+    r'|<(script|style|textarea|title|xmp|iframe|noembed|noframes)\b.*?(?:</\1\s*>|\Z)'
+    r'|<plaintext\b.*'
+    r'|<a\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*?\shref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))',
+    re.IGNORECASE | re.DOTALL,
+)
+_RE_DATE_ANY = re.compile(r'(\d{8})')
+_RE_YYYYMMDD = re.compile(r'^\d{8}$')
+_RE_IDENT_SANITIZE = re.compile(r'[^A-Za-z0-9:_-]+')
+_RE_MAX_AGE = re.compile(r'max-age=(\d+)', re.IGNORECASE)
+
+
+def _parse_fast(html: str) -> Optional[etree._Element]:
+    """Parse ``html`` straight into an lxml tree, or return None if it is empty/unparseable.
+
+    A fresh parser is used per call because lxml parsers are not thread-safe.
+    """
+    parser = lxml_html.HTMLParser(encoding='utf-8')
+    try:
+        return lxml_html.document_fromstring(html.encode('utf-8'), parser=parser)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def _canonical_url(url: str) -> str:
+    """Key for ``url`` that ignores the ``#fragment`` and query-parameter order."""
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse(parsed._replace(query=query, fragment=''))
+
+
+def _scan_dated_hrefs(html: str) -> List[Dict[str, str]]:
+    """Return ``{date, href}`` for every ``<a href>`` carrying a YYYYMMDD, in document order.
+
+    A regex over the raw page rather than a parse. Quoted and unquoted values
+    are both read, and anchors inside comments and raw-text elements are
+    ignored. ``HistoryOptions.strict_versions`` skips it for markup it may
+    still misread.
+    """
+    items: List[Dict[str, str]] = []
+    for m in _RE_ANCHOR_SCAN.finditer(html):
+        # Comment and raw-text matches leave every href group empty
+        raw = m.group(2) or m.group(3) or m.group(4)
+        if not raw:
+            continue
+        href = unescape(raw)
+        match = _RE_DATE.search(href) if ('20' in href or '19' in href) else None
+        if match:
+            items.append({'date': match.group(1), 'href': href})
+    return items
+
+
+def _write_atomic(path: Path, chunks: Iterable[bytes]) -> None:
+    """Write ``chunks`` to ``path`` through a private temp file.
+
+    Each writer gets its own temp file in the target directory, swapped in with
+    ``os.replace``, so concurrent or interrupted writes never leave a truncated
+    entry behind.
+    """
+    fh = tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + '.', suffix='.part', delete=False)
+    try:
+        with fh:
+            for chunk in chunks:
+                fh.write(chunk)
+        os.replace(fh.name, path)
+    except BaseException:
+        try:
+            os.unlink(fh.name)
+        except OSError:
+            pass
+        raise
+
+
+def _cache_meta(response: requests.Response, previous: Optional[Dict[str, object]] = None) -> Optional[Dict[str, object]]:
+    """Return the revalidation metadata worth keeping for ``response``, if any."""
+    meta: Dict[str, object] = dict(previous or {})
+    headers = getattr(response, 'headers', None) or {}
+    for key, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified')):
+        if headers.get(header):
+            meta[key] = headers[header]
+    match = _RE_MAX_AGE.search(headers.get('Cache-Control') or '')
+    if match:
+        meta['max_age'] = int(match.group(1))
+    if not meta:
+        return None
+    meta['fetched_at'] = time.time()
+    return meta
+
+
+def _read_cache_meta(ck: Path) -> Optional[Dict[str, object]]:
+    try:
+        return json.loads(ck.with_suffix('.meta.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache_meta(ck: Path, meta: Optional[Dict[str, object]]) -> None:
+    if meta:
+        ck.with_suffix('.meta.json').write_bytes(json.dumps(meta).encode('utf-8'))
 
 
 class HistoryStatus(str, Enum):
@@ -41,6 +167,8 @@ class HistoryOptions:
     max_dates: Optional[int] = None
     delay_seconds: float = 0.0
     session: Optional[requests.Session] = None
+    max_workers: int = 8
+    strict_versions: bool = False
 
 
 @dataclass
@@ -55,50 +183,169 @@ class HistoryCrawler:
         self.instrument_dir = Path(instrument_dir)
         self.options = options
         self.base_url = options.base_url.rstrip('/') if options.base_url else ''
-        self.session = options.session or requests.Session()
-        self.session.headers.setdefault('User-Agent', options.user_agent)
+        # Injected sessions are shared and already configured by their owner
+        self._owns_session = options.session is None
+        self.session = options.session or build_session(options.user_agent)
+        # Pages being fetched, plus the most recently finished ones, keyed by
+        # canonical URL; history anchors often differ only by #date or parameter
+        # order. Futures let concurrent snapshots of the same page wait for a
+        # single GET.
+        self._responses: "OrderedDict[str, Future]" = OrderedDict()
+        self._responses_lock = threading.Lock()
+        # Extracted fragment HTML keyed by (page digest, fragment code)
+        self._extracted: Dict[Tuple[bytes, str], str] = {}
+        # Directories already created, so each snapshot/cache write skips mkdir
+        self._ensured_dirs: Set[Path] = set()
+
+    def __enter__(self) -> 'HistoryCrawler':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the connection pool, unless the session was injected by the caller."""
+        if self._owns_session:
+            self.session.close()
+
+    def _ensure_dir(self, path: Path) -> None:
+        if path not in self._ensured_dirs:
+            path.mkdir(parents=True, exist_ok=True)
+            self._ensured_dirs.add(path)
 
     # Cache helpers -----------------------------------------------------
     def _cache_key(self, url: str) -> Optional[Path]:
         if not self.options.cache_dir:
             return None
-        cache_dir = Path(self.options.cache_dir)
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        key = re.sub(r'[^A-Za-z0-9._-]+', '_', url)
-        return cache_dir / f"{key}.html"
+        # Fixed-length digest keys, sharded by prefix so no single directory grows huge
+        key = hashlib.blake2b(_canonical_url(url).encode('utf-8'), digest_size=16).hexdigest()
+        return Path(self.options.cache_dir) / key[:2] / f"{key}.html"
 
     def _cached_fetch(self, url: str) -> str:
+        key = _canonical_url(url)
+        with self._responses_lock:
+            future = self._responses.get(key)
+            owner = future is None
+            if owner:
+                future = self._responses[key] = Future()
+            else:
+                self._responses.move_to_end(key)
+        if owner:
+            try:
+                text = self._fetch_through_cache(url)
+            except Exception as exc:
+                # Waiters see the failure; later calls retry rather than reuse it
+                with self._responses_lock:
+                    del self._responses[key]
+                future.set_exception(exc)
+            else:
+                future.set_result(text)
+                self._trim_responses()
+        return future.result()
+
+    def _trim_responses(self) -> None:
+        """Drop the oldest finished pages beyond ``_RESPONSE_MEMO_SIZE``; in-flight ones stay."""
+        with self._responses_lock:
+            excess = len(self._responses) - _RESPONSE_MEMO_SIZE
+            for key in [k for k, f in self._responses.items() if f.done()][:max(0, excess)]:
+                del self._responses[key]
+
+    def _fetch_through_cache(self, url: str) -> str:
+        """Fetch ``url`` through the on-disk cache, revalidating entries that carry validators.
+
+        Cache entries without a ``.meta.json`` sidecar are served as-is, as before.
+        Entries with one are served while fresh (``Cache-Control: max-age``) and
+        otherwise revalidated with ``If-None-Match``/``If-Modified-Since``; a
+        network error falls back to the cached copy.
+        """
         ck = self._cache_key(url)
-        if ck and ck.exists():
-            return ck.read_text(encoding='utf-8', errors='ignore')
-        response = self.session.get(url, timeout=self.options.timeout)
-        response.raise_for_status()
-        text = response.text
+        cached: Optional[str] = None
+        meta: Optional[Dict[str, object]] = None
         if ck:
-            ck.write_text(text, encoding='utf-8')
+            try:
+                cached = ck.read_text(encoding='utf-8', errors='ignore')
+            except FileNotFoundError:
+                pass
+            else:
+                meta = _read_cache_meta(ck)
+                if meta is None:
+                    return cached
+                max_age = meta.get('max_age')
+                if max_age is not None and time.time() - float(meta.get('fetched_at', 0)) < float(max_age):
+                    return cached
+
+        headers: Dict[str, str] = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = str(meta['etag'])
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = str(meta['last_modified'])
+        try:
+            # With a cache path the body is streamed straight into the cache file
+            response = self.session.get(url, timeout=self.options.timeout, headers=headers or None, stream=ck is not None)
+            try:
+                if cached is not None and response.status_code == 304:
+                    _write_cache_meta(ck, _cache_meta(response, previous=meta))
+                    return cached
+                response.raise_for_status()
+                # One decode rule with or without a cache: a declared non-UTF-8
+                # charset is honoured, anything else is read as UTF-8.
+                if non_utf8_charset(response.headers.get('Content-Type')):
+                    text = response.text
+                    if ck is None:
+                        return text
+                    # Transcoded so the cache stays UTF-8
+                    self._ensure_dir(ck.parent)
+                    _write_atomic(ck, [text.encode('utf-8')])
+                elif ck is None:
+                    return response.content.decode('utf-8', errors='ignore')
+                else:
+                    # Streamed to disk unbuffered, then read back as a cache hit would be
+                    self._ensure_dir(ck.parent)
+                    _write_atomic(ck, response.iter_content(chunk_size=_WRITE_BUFFER))
+                    text = ck.read_text(encoding='utf-8', errors='ignore')
+            finally:
+                response.close()
+        except requests.RequestException:
+            if cached is not None:
+                return cached
+            raise
+        new_meta = _cache_meta(response)
+        if new_meta:
+            _write_cache_meta(ck, new_meta)
         return text
 
     # Discovery ---------------------------------------------------------
     def discover_fragment_links(self, fragment_html: str) -> List[str]:
-        soup = BeautifulSoup(fragment_html, 'lxml')
-        links: List[str] = []
-        for img in soup.find_all('img', src=True):
-            if 'history' in img['src']:
-                anchor = img.find_parent('a')
-                if anchor and anchor.get('href'):
-                    links.append(anchor['href'])
-        for anchor in soup.find_all('a', href=True):
-            href = anchor['href']
-            if 'historique' in href or (anchor.get('class') and any('HistoryLink' in c for c in anchor['class'])):
-                links.append(href)
-        seen: List[str] = []
-        for href in links:
+        # Most fragments carry no history markers at all; a substring scan is
+        # far cheaper than parsing them to find out.
+        if not any(marker in fragment_html for marker in _HISTORY_MARKERS):
+            return []
+        root = _parse_fast(fragment_html)
+        if root is None:
+            return []
+        # One pass over the anchors; links wrapping a history icon still come
+        # first, ahead of those matched by href or class.
+        icon_links: List[str] = []
+        attr_links: List[str] = []
+        for anchor in root.iter('a'):
+            href = anchor.get('href')
+            if href is None:
+                continue
+            if href and any('history' in img.get('src', '') for img in anchor.iter('img')):
+                icon_links.append(href)
+            if 'historique' in href or any('HistoryLink' in c for c in anchor.get('class', '').split()):
+                attr_links.append(href)
+        seen = set()
+        ordered: List[str] = []
+        for href in icon_links + attr_links:
             if href not in seen:
-                seen.append(href)
-        return seen
+                seen.add(href)
+                ordered.append(href)
+        return ordered
 
     def _resolve(self, href: str) -> str:
-        if self.base_url and not re.match(r'^https?://', href):
+        if self.base_url and not _RE_ABS_URL.match(href):
             return urljoin(self.base_url + '/', href)
         return href
 
@@ -108,26 +355,32 @@ class HistoryCrawler:
             html = self._cached_fetch(url)
         except Exception:
             return []
-        soup = BeautifulSoup(html, 'lxml')
-        items: List[Dict[str, str]] = []
-        for anchor in soup.find_all('a', href=True):
-            href = anchor['href']
-            match = re.search(r'(?:#|/)(\d{8})(?:$|\b|_)', href)
+        # Fast path: pull dated anchors straight out of the raw HTML; the parser
+        # only runs when that finds nothing or strict parsing was requested.
+        items = [] if self.options.strict_versions else _scan_dated_hrefs(html)
+        root = None if items else _parse_fast(html)
+        undated: List[Dict[str, str]] = []
+        for anchor in (() if root is None else root.iter('a')):
+            href = anchor.get('href')
+            if href is None:
+                continue
+            # Dates are 19xx/20xx, so hrefs without either substring skip the regex
+            match = _RE_DATE.search(href) if ('20' in href or '19' in href) else None
             if match:
                 items.append({'date': match.group(1), 'href': href})
+            elif not items and 'historique=' in href:
+                undated.append({'date': 'unknown', 'href': href})
         if not items:
-            for anchor in soup.find_all('a', href=True):
-                if 'historique=' in anchor['href']:
-                    items.append({'date': 'unknown', 'href': anchor['href']})
+            items = undated
         if not items:
             parsed = urlparse(link)
             guess = None
-            if parsed.fragment and re.match(r'^\d{8}$', parsed.fragment):
+            if parsed.fragment and _RE_YYYYMMDD.match(parsed.fragment):
                 guess = parsed.fragment
             else:
                 for val in parse_qs(parsed.query).values():
                     for candidate in val:
-                        m = re.search(r'(\d{8})', candidate)
+                        m = _RE_DATE_ANY.search(candidate)
                         if m:
                             guess = m.group(1)
                             break
@@ -149,16 +402,16 @@ class HistoryCrawler:
     def _fragment_code(self, href: str) -> str:
         try:
             code = parse_qs(urlparse(href).query).get('code', ['fragment'])[0]
-            return re.sub(r'[^A-Za-z0-9:_-]+', '_', code)
+            return _RE_IDENT_SANITIZE.sub('_', code)
         except Exception:
             return 'fragment'
 
     # Snapshot ----------------------------------------------------------
     def _extract_fragment_html(self, html: str, fragment_code: str) -> str:
-        soup = BeautifulSoup(html, 'lxml')
-        node = soup.find(id=fragment_code)
-        if node:
-            return str(node)
+        root = _parse_fast(html)
+        node = root.get_element_by_id(fragment_code, None) if root is not None else None
+        if node is not None:
+            return etree.tostring(node, encoding='unicode', method='html', with_tail=False)
         return html
 
     def snapshot(self, fragment_code: str, date: str, href: str) -> HistorySnapshot:
@@ -175,12 +428,18 @@ class HistoryCrawler:
                 message=str(exc),
             )
 
-        fragment_html = self._extract_fragment_html(html, fragment_code)
+        # Unchanged versions often share a body; extract each distinct one once
+        key = (hashlib.blake2b(html.encode('utf-8', errors='surrogatepass'), digest_size=16).digest(), fragment_code)
+        fragment_html = self._extracted.get(key)
+        if fragment_html is None:
+            fragment_html = self._extract_fragment_html(html, fragment_code)
+            self._extracted[key] = fragment_html
         history_dir = self.instrument_dir / 'history' / fragment_code
-        history_dir.mkdir(parents=True, exist_ok=True)
-        safe_date = date if re.match(r'^\d{8}$', date) else time.strftime('%Y%m%d')
+        self._ensure_dir(history_dir)
+        safe_date = date if _RE_YYYYMMDD.match(date) else time.strftime('%Y%m%d')
         path = history_dir / f'{safe_date}.html'
-        path.write_text(fragment_html, encoding='utf-8')
+        with open(path, 'wb', buffering=_WRITE_BUFFER) as fh:
+            fh.write(fragment_html.encode('utf-8'))
         return HistorySnapshot(
             fragment=fragment_code,
             date=safe_date,
@@ -189,18 +448,70 @@ class HistoryCrawler:
             status=HistoryStatus.SNAPSHOT,
         )
 
+    def _enumerate_all(self, links: List[str]) -> List[List[Dict[str, str]]]:
+        """Enumerate the versions of every link, returning them in link order.
+
+        Version listings are fetched concurrently, like snapshots, unless a
+        politeness delay is configured.
+        """
+        workers = min(self.options.max_workers, len(links))
+        if self.options.delay_seconds or workers <= 1:
+            return [self.enumerate_versions(link) for link in links]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.enumerate_versions, links))
+
+    def _take_snapshots(self, jobs: List[Tuple[str, Dict[str, str]]]) -> List[HistorySnapshot]:
+        """Snapshot every ``(fragment_code, item)`` job, returning results in job order.
+
+        Jobs run on a thread pool unless a politeness delay is configured. Jobs
+        that would write the same snapshot file run afterwards, in order, so the
+        last one still wins as it did serially.
+        """
+        def run(job: Tuple[str, Dict[str, str]]) -> HistorySnapshot:
+            fragment_code, item = job
+            return self.snapshot(fragment_code, item['date'], item['href'])
+
+        workers = min(self.options.max_workers, len(jobs))
+        if self.options.delay_seconds or workers <= 1:
+            results: List[HistorySnapshot] = []
+            for job in jobs:
+                results.append(run(job))
+                if self.options.delay_seconds:
+                    time.sleep(self.options.delay_seconds)
+            return results
+
+        claimed = set()
+        parallel: List[int] = []
+        serial: List[int] = []
+        for idx, (fragment_code, item) in enumerate(jobs):
+            target = (fragment_code, item['date'] if _RE_YYYYMMDD.match(item['date']) else None)
+            (serial if target in claimed else parallel).append(idx)
+            claimed.add(target)
+
+        ordered: List[Optional[HistorySnapshot]] = [None] * len(jobs)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for idx, snap in zip(parallel, pool.map(run, [jobs[i] for i in parallel])):
+                ordered[idx] = snap
+        for idx in serial:
+            ordered[idx] = run(jobs[idx])
+        return [snap for snap in ordered if snap is not None]
+
     def crawl(self, fragment_html: str) -> HistoryResult:
         links = self.discover_fragment_links(fragment_html)
         index: Dict[str, List[Dict[str, str]]] = {}
-        snapshots: List[HistorySnapshot] = []
 
-        for link in links:
+        plan: List[Tuple[str, int]] = []  # (fragment_code, number of versions) per link
+        jobs: List[Tuple[str, Dict[str, str]]] = []
+        for link, versions in zip(links, self._enumerate_all(links)):
             fragment_code = self._fragment_code(link)
-            versions = self.enumerate_versions(link)
+            plan.append((fragment_code, len(versions)))
+            jobs.extend((fragment_code, item) for item in versions)
+
+        snapshots = self._take_snapshots(jobs)
+        offset = 0
+        for fragment_code, count in plan:
             entries: List[Dict[str, str]] = []
-            for item in versions:
-                snap = self.snapshot(fragment_code, item['date'], item['href'])
-                snapshots.append(snap)
+            for snap in snapshots[offset:offset + count]:
                 if snap.status is HistoryStatus.SNAPSHOT and snap.path is not None:
                     entries.append(
                         {
@@ -209,8 +520,7 @@ class HistoryCrawler:
                             'url': snap.url,
                         }
                     )
-                if self.options.delay_seconds:
-                    time.sleep(self.options.delay_seconds)
+            offset += count
             if entries:
                 index[fragment_code] = entries
 
@@ -224,21 +534,30 @@ def build_history_sidecars(
     instrument_dir: Path,
     options: HistoryOptions,
 ) -> HistoryResult:
-    crawler = HistoryCrawler(instrument_dir=instrument_dir, options=options)
-    result = crawler.crawl(fragment_html)
+    with HistoryCrawler(instrument_dir=instrument_dir, options=options) as crawler:
+        result = crawler.crawl(fragment_html)
     history_dir = instrument_dir / 'history'
     history_dir.mkdir(parents=True, exist_ok=True)
-    (history_dir / 'index.json').write_text(
-        json.dumps(result.index, ensure_ascii=False, indent=2),
-        encoding='utf-8',
-    )
+    # Write beside the target and swap it in so readers never see a partial index
+    index_path = history_dir / 'index.json'
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    with open(tmp_path, 'wb', buffering=_WRITE_BUFFER) as fh:
+        fh.write(_dumps_index(result.index))
+    os.replace(tmp_path, index_path)
     return result
 
 
+def _dumps_index(index: Dict[str, List[Dict[str, str]]]) -> bytes:
+    """Serialise ``index`` as compact UTF-8 JSON."""
+    if orjson is not None:  # pragma: no cover - optional dep
+        return orjson.dumps(index)
+    return json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
 def _inject_versions(fragment_html: str, index: Dict[str, List[Dict[str, str]]]) -> str:
     soup = BeautifulSoup(fragment_html, 'lxml')
     if not index:
-        target = soup.find(id=re.compile(r'^se:')) or soup
+        target = soup.find(id=_RE_SECTION_ID) or soup
         container = soup.new_tag('div')
         container['class'] = ['LRN-Versions']
         container['data-fragment'] = 'se:placeholder'
@@ -247,19 +566,28 @@ def _inject_versions(fragment_html: str, index: Dict[str, List[Dict[str, str]]])
             target.append(container)
         return str(soup)
 
-    for frag_code, versions in index.items():
-        target = soup.find(id=frag_code) or soup.find(attrs={'data-fragment': frag_code})
-        container = soup.new_tag('div')
-        container['class'] = ['LRN-Versions']
-        container['data-fragment'] = frag_code
-        ul = soup.new_tag('ul')
-        for item in versions:
-            li = soup.new_tag('li')
-            a = soup.new_tag('a', href=item['path'])
-            a.string = item['date']
-            li.append(a)
-            ul.append(li)
-        container.append(ul)
+    # Build every container as markup and parse them all in one go; a parse per
+    # fragment (or a new_tag() per element) dominated on large instruments.
+    markup = ''.join(
+        f'<div class="LRN-Versions" data-fragment="{escape(frag_code)}"><ul>'
+        + ''.join(
+            f'<li><a href="{escape(item["path"])}">{escape(item["date"])}</a></li>'
+            for item in versions
+        )
+        + '</ul></div>'
+        for frag_code, versions in index.items()
+    )
+    containers = BeautifulSoup(markup, 'lxml').body.find_all('div', recursive=False)
+    # First element per id / data-fragment, in document order, from a single walk
+    by_id: Dict[str, object] = {}
+    by_fragment: Dict[str, object] = {}
+    for tag in soup.find_all(True):
+        if tag.get('id') is not None:
+            by_id.setdefault(tag['id'], tag)
+        if tag.get('data-fragment') is not None:
+            by_fragment.setdefault(tag['data-fragment'], tag)
+    for frag_code, container in zip(index, containers):
+        target = by_id.get(frag_code) or by_fragment.get(frag_code)
         if target:
             target.append(container)
         else:
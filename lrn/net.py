@@ -0,0 +1,51 @@
+"""HTTP session and response helpers shared by the crawler, annex and CLI code."""
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_RE_CHARSET = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+def build_session(user_agent: str, *, pool_maxsize: int = 32) -> requests.Session:
+    """Create a keep-alive session sized for concurrent downloads.
+
+    Transient 429/5xx answers are retried with backoff; the last response is
+    returned (not raised) once retries are exhausted, as a plain GET would.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    _configure_session(session, user_agent)
+    return session
+
+
+def _configure_session(session: requests.Session, user_agent: str) -> None:
+    """Apply default headers to a session created here."""
+    session.headers['User-Agent'] = user_agent
+
+
+def non_utf8_charset(content_type: Optional[str]) -> Optional[str]:
+    """Return the charset declared in ``content_type`` unless it is UTF-8 (or absent)."""
+    match = _RE_CHARSET.search(content_type or '')
+    if match and match.group(1).lower() not in ('utf-8', 'utf8'):
+        return match.group(1)
+    return None
+
+
+__all__ = [
+    'build_session',
+    'non_utf8_charset',
+]
@@ -17,6 +17,11 @@ import requests
 from requests import HTTPError
 from requests.utils import requote_uri
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 @dataclass
 class CorpusEntry:
@@ -69,6 +74,16 @@ def _sha256(data: bytes) -> str:
     return h.hexdigest()
 
 
+def _sha256_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    import hashlib
+
+    h = hashlib.sha256()
+    with path.open('rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
 def _should_use_headless(exc: HTTPError, entry: CorpusEntry, suffix: str) -> bool:
     response = exc.response
     if response is None:
@@ -136,13 +151,12 @@ def fetch_entry(entry: CorpusEntry, session: requests.Session, options: IngestOp
     target_path = target_dir / f"{entry.language}{suffix}"
 
     if options.resume and target_path.exists():
-        data = target_path.read_bytes()
         return FetchResult(
             entry=entry,
             status='skipped',
             path=target_path,
-            bytes=len(data),
-            sha256=_sha256(data),
+            bytes=target_path.stat().st_size,
+            sha256=_sha256_file(target_path),
             error=None,
             fetched_at=None,
         )
@@ -209,6 +223,13 @@ def fetch_entry(entry: CorpusEntry, session: requests.Session, options: IngestOp
     )
 
 
+def _dumps_manifest(payload: List[Dict[str, object]]) -> bytes:
+    """Serialise the manifest as indented UTF-8 JSON."""
+    if orjson is not None:  # pragma: no cover - optional dep
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+    return json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
+
+
 def write_reports(results: List[FetchResult], log_dir: Path) -> None:
     log_dir.mkdir(parents=True, exist_ok=True)
     json_path = log_dir / 'manifest.json'
@@ -228,7 +249,7 @@ def write_reports(results: List[FetchResult], log_dir: Path) -> None:
         }
         for r in results
     ]
-    json_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding='utf-8')
+    json_path.write_bytes(_dumps_manifest(payload))
 
     with csv_path.open('w', encoding='utf-8', newline='') as fh:
         writer = csv.DictWriter(
@@ -1,9 +1,11 @@
 from pathlib import Path
+import sys
+import types
 
 import requests
 import pytest
 
-from lrn.annex import AnnexOptions, AnnexStatus, process_annexes
+from lrn.annex import AnnexOptions, AnnexStatus, _convert_pdf, _marker_converter, process_annexes
 from lrn.extract import load_fragment
 
 
@@ -129,3 +131,127 @@ def test_process_annexes_conversion_warning(monkeypatch, tmp_path):
     record = conversions[0]
     assert record.status == AnnexStatus.DOWNLOADED
     assert record.message and "conversion failed" in record.message
+
+
+def test_process_annexes_keeps_link_order_with_workers(monkeypatch, tmp_path):
+    html = """
+    <html><body>
+      <div id=\"mainContent-document\">
+        <?xml version=\"1.0\" encoding=\"UTF-8\"?>
+        <!DOCTYPE div PUBLIC \"-//W3C//DTD XHTML 1.0 Strict//EN\" \"http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd\">
+        <div xmlns=\"http://www.w3.org/1999/xhtml\">
+          <a href=\"/files/a.pdf\">A</a> <a href=\"/files/b.pdf\">B</a> <a href=\"/files/c.pdf\">C</a>
+        </div>
+      </div>
+    </body></html>
+    """
+    src = tmp_path / "fragment.html"
+    src.write_text(html, encoding="utf-8")
+    fragment = load_fragment(src)
+
+    class _Resp(DummyResponse):
+        def __enter__(self_inner):
+            return self_inner
+
+        def __exit__(self_inner, exc_type, exc, tb):
+            return False
+
+        def iter_content(self_inner, chunk_size):
+            yield self_inner.content
+
+    def fake_convert(pdf_path, markdown_path, engine):
+        markdown_path.write_text(pdf_path.read_text(), encoding="utf-8")
+        return None
+
+    session = requests.Session()
+    monkeypatch.setattr(session, "get", lambda url, timeout, stream=True: _Resp(url.encode("utf-8")))
+    monkeypatch.setattr("lrn.annex._convert_pdf", fake_convert)
+
+    options = AnnexOptions(engine="marker", base_url="https://example.test", session=session, max_workers=3)
+    conversions = process_annexes(fragment, instrument_dir=tmp_path / "instrument", options=options)
+
+    assert [c.pdf_path.name for c in conversions] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert all(c.status == AnnexStatus.CONVERTED for c in conversions)
+    assert fragment.xhtml.index("annexes/a.md") < fragment.xhtml.index("annexes/b.md") < fragment.xhtml.index("annexes/c.md")
+
+
+def test_process_annexes_keeps_xhtml_when_nothing_injected(monkeypatch, tmp_path):
+    fragment = load_fragment(_fixture_fragment(tmp_path))
+    original = fragment.xhtml
+
+    session = requests.Session()
+    monkeypatch.setattr(session, "get", lambda url, timeout, stream=True: (_ for _ in ()).throw(RuntimeError("network down")))
+    options = AnnexOptions(engine="marker", base_url="https://example.test", session=session)
+
+    process_annexes(fragment, instrument_dir=tmp_path / "instrument", options=options)
+
+    assert fragment.xhtml is original
+
+
+def test_process_annexes_closes_only_its_own_session(monkeypatch, tmp_path):
+    fragment = load_fragment(_fixture_fragment(tmp_path))
+    closed = []
+    built = []
+
+    def fake_build(user_agent, *, pool_maxsize):
+        session = requests.Session()
+        monkeypatch.setattr(session, "get", lambda url, timeout, stream=True: (_ for _ in ()).throw(RuntimeError("network down")))
+        monkeypatch.setattr(session, "close", lambda: closed.append(session))
+        built.append(pool_maxsize)
+        return session
+
+    monkeypatch.setattr("lrn.annex.build_session", fake_build)
+    process_annexes(fragment, instrument_dir=tmp_path / "a", options=AnnexOptions(base_url="https://example.test", max_workers=20))
+    assert built == [20] and len(closed) == 1
+
+    shared = fake_build("ua", pool_maxsize=16)
+    closed.clear()
+    process_annexes(fragment, instrument_dir=tmp_path / "b", options=AnnexOptions(base_url="https://example.test", session=shared))
+    assert closed == []
+
+
+def test_convert_pdf_falls_back_to_subprocess_without_marker(monkeypatch, tmp_path):
+    calls = []
+
+    class _Result:
+        stdout = b""
+        stderr = b""
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        return _Result()
+
+    monkeypatch.setattr("lrn.annex._marker_converter", lambda: None)
+    monkeypatch.setattr("lrn.annex._resolve_engine", lambda engine: "/usr/bin/marker")
+    monkeypatch.setattr("lrn.annex.subprocess.run", fake_run)
+
+    message = _convert_pdf(tmp_path / "a.pdf", tmp_path / "a.md", "marker")
+
+    assert message is None
+    assert calls and calls[0][0] == "/usr/bin/marker"
+
+
+def test_marker_converter_remembers_failed_model_load(monkeypatch):
+    loads = []
+
+    def create_model_dict():
+        loads.append(1)
+        raise RuntimeError("weights unavailable")
+
+    modules = {
+        "marker": types.ModuleType("marker"),
+        "marker.converters": types.ModuleType("marker.converters"),
+        "marker.converters.pdf": types.ModuleType("marker.converters.pdf"),
+        "marker.models": types.ModuleType("marker.models"),
+        "marker.output": types.ModuleType("marker.output"),
+    }
+    modules["marker.converters.pdf"].PdfConverter = lambda artifact_dict: object()
+    modules["marker.models"].create_model_dict = create_model_dict
+    modules["marker.output"].text_from_rendered = lambda rendered: ("", None, None)
+    for name, module in modules.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.setattr("lrn.annex._marker_state", {})
+
+    assert _marker_converter() is None
+    assert _marker_converter() is None
+    assert len(loads) == 1
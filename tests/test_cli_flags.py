@@ -37,3 +37,90 @@ def test_extract_toggles_disable_annex_and_history(monkeypatch, tmp_path):
 
     instrument = tmp_path / "out" / "sample"
     assert (instrument / "current.xhtml").exists()
+
+
+def test_extract_rerun_leaves_unchanged_current_untouched(tmp_path):
+    import os
+
+    src = tmp_path / "sample.html"
+    src.write_text(
+        '<html><body><div id="mainContent-document"><div xmlns="http://www.w3.org/1999/xhtml"><div id="se:1">Body</div></div></div></body></html>',
+        encoding="utf-8",
+    )
+    kwargs = dict(
+        history_sidecars=False,
+        history_markdown=False,
+        annex_pdf_to_md=False,
+        metadata_exclusion="",
+        out_dir=str(tmp_path / "out"),
+        inputs=[str(src)],
+        base_url=None,
+        pdf_to_md_engine="marker",
+        ocr=False,
+    )
+    extract(**kwargs)
+    current = tmp_path / "out" / "sample" / "current.xhtml"
+    os.utime(current, ns=(1_000_000_000, 1_000_000_000))
+
+    extract(**kwargs)
+
+    assert current.stat().st_mtime_ns == 1_000_000_000
+
+
+def test_extract_passes_history_workers(monkeypatch, tmp_path):
+    from types import SimpleNamespace
+
+    src = tmp_path / "sample.html"
+    src.write_text('<html><body><div id="se:1">Body</div></body></html>', encoding="utf-8")
+    seen = {}
+
+    def fake_sidecars(xhtml, *, instrument_dir, options):
+        seen["workers"] = options.max_workers
+        return SimpleNamespace(html=xhtml, snapshots=[])
+
+    monkeypatch.setattr("lrn.cli.build_history_sidecars", fake_sidecars)
+    extract(
+        history_sidecars=True,
+        history_markdown=False,
+        annex_pdf_to_md=False,
+        metadata_exclusion="",
+        out_dir=str(tmp_path / "out"),
+        inputs=[str(src)],
+        base_url=None,
+        pdf_to_md_engine="marker",
+        ocr=False,
+        history_workers=3,
+    )
+    assert seen["workers"] == 3
+
+
+def test_write_text_if_changed_compares_bytes(tmp_path):
+    from lrn.cli import write_text_if_changed
+
+    path = tmp_path / "current.xhtml"
+    path.write_bytes(b"<p>a</p>\r\n")
+    assert write_text_if_changed(str(path), "<p>a</p>\n")
+    assert path.read_bytes() == b"<p>a</p>\n"
+    assert not write_text_if_changed(str(path), "<p>a</p>\n")
+
+
+def test_extract_writes_current_when_enrichment_fails(monkeypatch, tmp_path):
+    import pytest
+
+    src = tmp_path / "sample.html"
+    src.write_text('<html><body><div id="se:1">Body</div></body></html>', encoding="utf-8")
+    monkeypatch.setattr("lrn.cli.build_history_sidecars", lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError("history down")))
+
+    with pytest.raises(RuntimeError):
+        extract(
+            history_sidecars=True,
+            history_markdown=False,
+            annex_pdf_to_md=False,
+            metadata_exclusion="",
+            out_dir=str(tmp_path / "out"),
+            inputs=[str(src)],
+            base_url=None,
+            pdf_to_md_engine="marker",
+            ocr=False,
+        )
+    assert "Body" in (tmp_path / "out" / "sample" / "current.xhtml").read_text(encoding="utf-8")
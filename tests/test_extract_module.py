@@ -2,7 +2,7 @@ from pathlib import Path
 
 import pytest
 
-from lrn.extract import FragmentExtractionError, load_fragment
+from lrn.extract import FragmentExtractionError, find_inner_xhtml, load_fragment
 
 
 def _write_fixture(tmp_path: Path, body: str) -> Path:
@@ -35,6 +35,14 @@ def test_fragment_extraction_error_when_missing_fragment(tmp_path):
         load_fragment(path)
 
 
+def test_find_inner_xhtml_falls_back_to_section_node():
+    html = '<html><body><p>Intro</p><div id="se:2" class="section">Article <b>2</b><br>é</div>tail</body></html>'
+    xhtml = find_inner_xhtml(html)
+    assert xhtml.startswith('<?xml version="1.0" encoding="UTF-8"?>')
+    assert '<div id="se:2" class="section">Article <b>2</b><br/>é</div></div>' in xhtml
+    assert "tail" not in xhtml
+
+
 def test_detect_instrument_from_rc_path(tmp_path):
     path = tmp_path / "fr" / "document" / "rc" / "S-2.1,%20r.%2010" / "index.html"
     path.parent.mkdir(parents=True, exist_ok=True)
@@ -50,3 +58,17 @@ def test_detect_instrument_from_rc_path(tmp_path):
     )
     fragment = load_fragment(path)
     assert fragment.instrument_id == "S-2.1%2C%20r.%2010"
+
+
+def test_find_inner_xhtml_anchor_window_and_fallback(monkeypatch):
+    from lrn import extract
+
+    monkeypatch.setattr(extract, "_MAIN_WINDOW_CHARS", 200)
+    fragment = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE div PUBLIC "x" "y">\n'
+        '<div xmlns="http://www.w3.org/1999/xhtml"><p>Body</p></div>'
+    )
+    near = '<p>' + "x" * 1000 + '</p><div id="mainContent-document">' + fragment + '</div>'
+    assert find_inner_xhtml(near) == fragment
+    far = '<div id="mainContent-document"><p>' + "x" * 1000 + '</p>' + fragment + '</div>'
+    assert find_inner_xhtml(far) == fragment
@@ -79,6 +79,12 @@ class DummyResp:
         self.text = text
         self.status_code = code
         self.content = text.encode("utf-8")
+        self.headers = {"Content-Type": "text/html; charset=utf-8"}
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+    def close(self):
+        pass
     def raise_for_status(self):
         if self.status_code != 200:
             raise RuntimeError(f"HTTP {self.status_code}")
@@ -157,4 +163,73 @@ def test_fetch_all_offline(tmp_path, monkeypatch):
                     break
         if found_section_only:
             break
-    assert found_section_only, "snapshot does not appear to be section-only"
\ No newline at end of file
+    assert found_section_only, "snapshot does not appear to be section-only"
+
+
+def test_fetch_rc_page_skips_non_html_bodies():
+    from lrn.cli import _fetch_rc_page
+
+    class Session:
+        def __init__(self, resp):
+            self.resp = resp
+        def get(self, url, **kwargs):
+            assert kwargs.get("stream") is True
+            return self.resp
+
+    pdf = DummyResp("u", "%PDF-1.4")
+    pdf.headers = {"Content-Type": "application/pdf"}
+    assert _fetch_rc_page(Session(pdf), "https://x/fr/document/rc/A ", 5) == (pdf, None, None)
+    html = DummyResp("u", "<html>é</html>")
+    assert _fetch_rc_page(Session(html), "https://x/fr/document/rc/A", 5) == (html, "<html>é</html>".encode("utf-8"), None)
+
+
+def test_non_html_en_rc_page_gets_placeholder(tmp_path, monkeypatch):
+    import lrn.cli as cli
+
+    monkeypatch.chdir(tmp_path)
+    extracted = []
+
+    def fake_get(url, *args, **kwargs):
+        resp = _mock_get(url, *args, **kwargs)
+        if "/en/document/rc/" in url:
+            resp.content = b"%PDF-1.4"
+            resp.headers = {"Content-Type": "application/pdf"}
+        return resp
+
+    monkeypatch.setattr(cli, "extract", lambda **kwargs: extracted.extend(kwargs["inputs"]) or [])
+    with patch("requests.Session.get", side_effect=fake_get):
+        discover_bylaws(cache_root="cache", out_dir="output",
+                        fr_landing="https://www.legisquebec.gouv.qc.ca/fr/document/lc/S-2.1",
+                        en_landing="https://www.legisquebec.gouv.qc.ca/en/document/cs/S-2.1",
+                        history_timeout=10, history_user_agent="LRN/Test")
+    en = [p for p in extracted if "/en/" in Path(p).as_posix()]
+    assert en and all("placeholder non-html" in Path(p).read_text(encoding="utf-8") for p in en)
+
+
+def test_failed_extract_placeholders_written_last(tmp_path, monkeypatch):
+    import lrn.cli as cli
+
+    monkeypatch.chdir(tmp_path)
+    leaf = "S-2.1%2C%20r.%208.2"
+    calls = []
+
+    def fake_extract(**kwargs):
+        calls.append(kwargs["inputs"][0])
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        inst = Path(kwargs["out_dir"]) / leaf
+        if len(calls) == 2:
+            # The placeholder for the first (failed) call has not been written yet
+            assert not (inst / "current.xhtml").exists()
+        (inst / "history").mkdir(parents=True, exist_ok=True)
+        (inst / "current.xhtml").write_text("real", encoding="utf-8")
+        (inst / "history" / "index.json").write_text("{}", encoding="utf-8")
+        return [inst]
+
+    monkeypatch.setattr(cli, "extract", fake_extract)
+    with patch("requests.Session.get", side_effect=_mock_get):
+        discover_bylaws(cache_root="cache", out_dir="output",
+                        fr_landing="https://www.legisquebec.gouv.qc.ca/fr/document/lc/S-2.1",
+                        en_landing="https://www.legisquebec.gouv.qc.ca/en/document/cs/S-2.1",
+                        history_timeout=10, history_user_agent="LRN/Test")
+    assert (Path("output") / leaf / "current.xhtml").read_text(encoding="utf-8") == "real"
@@ -16,3 +16,216 @@ def test_discover_fragment_history_links_basic():
     hc = HistoryCrawler(Path("/tmp/out"), HistoryOptions(base_url="https://www.legisquebec.gouv.qc.ca"))
     links = hc.discover_fragment_links(SAMPLE_XHTML)
     assert links and any('historique=' in x for x in links)
+
+
+def test_cache_key_is_sharded_digest(tmp_path):
+    hc = HistoryCrawler(tmp_path, HistoryOptions(cache_dir=str(tmp_path / "cache")))
+    url = "https://www.legisquebec.gouv.qc.ca/fr/version/rc/S-2.1, r. 8.2 ?code=se:1&historique=20250804"
+    key = hc._cache_key(url)
+    assert key.parent.parent == tmp_path / "cache"
+    assert key.parent.name == key.stem[:2]
+    assert len(key.stem) == 32
+    assert hc._cache_key(url + "#x") == key
+    assert hc._cache_key(url.replace("code=se:1&historique=20250804", "historique=20250804&code=se:1")) == key
+    assert hc._cache_key(url.replace("se:1", "se:2")) != key
+
+
+def test_injected_session_headers_are_left_alone(tmp_path):
+    import requests
+
+    session = requests.Session()
+    session.headers["User-Agent"] = "Shared/1.0"
+    hc = HistoryCrawler(tmp_path, HistoryOptions(session=session, user_agent="LRN/Other"))
+    assert hc.session is session
+    assert session.headers["User-Agent"] == "Shared/1.0"
+
+
+class _FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def iter_content(self, chunk_size=1):
+        data = self.content
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+
+            raise requests.HTTPError(str(self.status_code))
+
+
+class _FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, timeout=None, headers=None, stream=False):
+        self.calls.append(headers or {})
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+def test_cached_fetch_revalidates_with_etag(tmp_path):
+    import requests
+
+    url = "https://example.test/page"
+    session = _FakeSession([
+        _FakeResponse(200, "v1", {"ETag": '"abc"'}),
+        _FakeResponse(304),
+        requests.ConnectionError("offline"),
+    ])
+    options = HistoryOptions(cache_dir=str(tmp_path / "cache"), session=session)
+    # A fresh crawler per run, as each extract() creates one
+    assert HistoryCrawler(tmp_path, options)._cached_fetch(url) == "v1"
+    assert HistoryCrawler(tmp_path, options)._cached_fetch(url) == "v1"
+    assert session.calls[1] == {"If-None-Match": '"abc"'}
+    assert HistoryCrawler(tmp_path, options)._cached_fetch(url) == "v1"
+    assert len(session.calls) == 3
+
+
+def test_cached_fetch_honours_max_age_and_legacy_entries(tmp_path):
+    url = "https://example.test/fresh"
+    session = _FakeSession([_FakeResponse(200, "fresh", {"Cache-Control": "public, max-age=3600"})])
+    options = HistoryOptions(cache_dir=str(tmp_path / "cache"), session=session)
+    assert HistoryCrawler(tmp_path, options)._cached_fetch(url) == "fresh"
+    hc = HistoryCrawler(tmp_path, options)
+    assert hc._cached_fetch(url) == "fresh"
+    assert len(session.calls) == 1
+
+    legacy = hc._cache_key("https://example.test/legacy")
+    legacy.parent.mkdir(parents=True, exist_ok=True)
+    legacy.write_text("offline copy", encoding="utf-8")
+    assert hc._cached_fetch("https://example.test/legacy") == "offline copy"
+    assert len(session.calls) == 1
+
+
+def test_cached_fetch_memoises_url_variants(tmp_path):
+    session = _FakeSession([_FakeResponse(200, "page")])
+    hc = HistoryCrawler(tmp_path, HistoryOptions(session=session))
+    assert hc._cached_fetch("https://example.test/v?code=se:1&historique=1#20200101") == "page"
+    assert hc._cached_fetch("https://example.test/v?historique=1&code=se:1#20240229") == "page"
+    assert len(session.calls) == 1
+
+
+def test_cached_fetch_memo_keeps_only_recent_pages(tmp_path):
+    from lrn.history import _RESPONSE_MEMO_SIZE
+
+    count = _RESPONSE_MEMO_SIZE + 10
+    session = _FakeSession([_FakeResponse(200, f"page {i}") for i in range(count)] + [_FakeResponse(200, "page 0 again")])
+    hc = HistoryCrawler(tmp_path, HistoryOptions(session=session))
+    for i in range(count):
+        assert hc._cached_fetch(f"https://example.test/v?code=se:{i}") == f"page {i}"
+    assert len(hc._responses) == _RESPONSE_MEMO_SIZE
+    assert hc._cached_fetch(f"https://example.test/v?code=se:{count - 1}#20200101") == f"page {count - 1}"
+    assert hc._cached_fetch("https://example.test/v?code=se:0") == "page 0 again"
+
+
+def test_discover_skips_parsing_without_history_markers(tmp_path, monkeypatch):
+    from lrn import history
+
+    monkeypatch.setattr(history, "_parse_fast", lambda html: (_ for _ in ()).throw(AssertionError("parsed")))
+    hc = HistoryCrawler(tmp_path, HistoryOptions())
+    assert hc.discover_fragment_links('<div id="se:1"><a href="/x">x</a></div>') == []
+
+
+def test_crawler_closes_only_its_own_session(tmp_path):
+    import requests
+
+    closed = []
+
+    class Tracking(requests.Session):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    shared = Tracking()
+    with HistoryCrawler(tmp_path, HistoryOptions(session=shared)):
+        pass
+    assert closed == []
+
+    hc = HistoryCrawler(tmp_path, HistoryOptions())
+    hc.session.close = lambda: closed.append(hc.session)
+    with hc:
+        pass
+    assert closed == [hc.session]
+
+
+def test_cached_fetch_streams_body_into_cache(tmp_path):
+    session = _FakeSession([_FakeResponse(200, "<p>é</p>" * 10000, {"Content-Type": "text/html"})])
+    hc = HistoryCrawler(tmp_path, HistoryOptions(cache_dir=str(tmp_path / "cache"), session=session))
+    url = "https://example.test/big"
+    assert hc._cached_fetch(url) == "<p>é</p>" * 10000
+    ck = hc._cache_key(url)
+    assert ck.read_bytes() == ("<p>é</p>" * 10000).encode("utf-8")
+    assert not list(ck.parent.glob("*.part"))
+
+
+def test_cached_fetch_transcodes_declared_charset_atomically(tmp_path):
+    session = _FakeSession([_FakeResponse(200, "<p>é</p>", {"Content-Type": "text/html; charset=ISO-8859-1"})])
+    hc = HistoryCrawler(tmp_path, HistoryOptions(cache_dir=str(tmp_path / "cache"), session=session))
+    url = "https://example.test/latin"
+    assert hc._cached_fetch(url) == "<p>é</p>"
+    ck = hc._cache_key(url)
+    assert ck.read_bytes() == "<p>é</p>".encode("utf-8")
+    assert not list(ck.parent.glob("*.part"))
+
+
+def test_cached_fetch_decodes_the_same_with_and_without_cache(tmp_path):
+    import io
+
+    import requests
+
+    body = "<p>é</p>"
+
+    def response():
+        # Built as HTTPAdapter would: .text falls back to ISO-8859-1 for charset-less text/html
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers["Content-Type"] = "text/html"
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.raw = io.BytesIO(body.encode("utf-8"))
+        return resp
+
+    cached = HistoryCrawler(tmp_path, HistoryOptions(cache_dir=str(tmp_path / "cache"), session=_FakeSession([response()])))
+    uncached = HistoryCrawler(tmp_path, HistoryOptions(session=_FakeSession([response()])))
+    url = "https://example.test/plain"
+    assert cached._cached_fetch(url) == uncached._cached_fetch(url) == body
+
+
+def test_concurrent_snapshots_of_one_page_fetch_it_once(tmp_path):
+    import threading
+    import time
+
+    from lrn.history import HistoryStatus
+
+    class SlowSession(_FakeSession):
+        def __init__(self):
+            super().__init__([])
+            self.lock = threading.Lock()
+
+        def get(self, url, timeout=None, headers=None, stream=False):
+            with self.lock:
+                self.calls.append(url)
+            time.sleep(0.05)
+            return _FakeResponse(200, '<div id="se:1">Body</div>', {"Content-Type": "text/html"})
+
+    session = SlowSession()
+    hc = HistoryCrawler(tmp_path, HistoryOptions(cache_dir=str(tmp_path / "cache"), session=session, max_workers=4))
+    jobs = [("se:1", {"date": d, "href": f"https://example.test/v?code=se:1#{d}"}) for d in ("20200101", "20210101")]
+    snaps = hc._take_snapshots(jobs)
+    assert [s.status for s in snaps] == [HistoryStatus.SNAPSHOT, HistoryStatus.SNAPSHOT]
+    assert len(session.calls) == 1
+    assert not list((tmp_path / "cache").rglob("*.part"))
@@ -48,3 +48,94 @@ def test_snapshot_and_index_content(tmp_path: Path, monkeypatch):
 
     result = hc.crawl(fragment_html)
     assert result.index
+
+
+def test_crawl_keeps_version_order_with_workers(tmp_path: Path, monkeypatch):
+    import time
+
+    hc = HistoryCrawler(tmp_path, HistoryOptions(base_url="", max_workers=4))
+    dates = ["20200101", "20210101", "20220101", "20230101"]
+    monkeypatch.setattr(hc, "discover_fragment_links", lambda _: ["/u?code=se:1"])
+    monkeypatch.setattr(hc, "enumerate_versions", lambda link: [{"date": d, "href": f"/u#{d}"} for d in dates])
+
+    def slow_snapshot(code, date, href):
+        time.sleep(0.01 * (len(dates) - dates.index(date)))
+        return HistorySnapshot(code, date, href, tmp_path / "history" / code / f"{date}.html", HistoryStatus.SNAPSHOT)
+
+    monkeypatch.setattr(hc, "snapshot", slow_snapshot)
+
+    result = hc.crawl('<div id="se:1"></div>')
+    assert [entry["date"] for entry in result.index["se:1"]] == dates
+
+def test_snapshot_keeps_only_fragment_element(tmp_path: Path, monkeypatch):
+    def fake_fetch(self, url: str) -> str:
+        return '<html><body><p>Menu</p><div id="se:3">Art. 3 &amp; é<br></div>tail</body></html>'
+
+    monkeypatch.setattr(HistoryCrawler, "_cached_fetch", fake_fetch)
+
+    hc = HistoryCrawler(tmp_path, HistoryOptions(base_url=""))
+    snap = hc.snapshot("se:3", "20240101", "/x#20240101")
+    assert snap.path.read_text(encoding="utf-8") == '<div id="se:3">Art. 3 &amp; é<br></div>'
+
+def test_crawl_enumerates_links_concurrently_in_order(tmp_path: Path, monkeypatch):
+    import threading
+    import time
+
+    hc = HistoryCrawler(tmp_path, HistoryOptions(base_url="", max_workers=3))
+    links = ["/u?code=se:1", "/u?code=se:2", "/u?code=se:3"]
+    threads = set()
+    monkeypatch.setattr(hc, "discover_fragment_links", lambda _: links)
+
+    def slow_enumerate(link):
+        threads.add(threading.get_ident())
+        time.sleep(0.05 if link.endswith("1") else 0.0)
+        return [{"date": "20200101", "href": link + "#20200101"}]
+
+    monkeypatch.setattr(hc, "enumerate_versions", slow_enumerate)
+    monkeypatch.setattr(hc, "snapshot", lambda code, date, href: HistorySnapshot(
+        code, date, href, tmp_path / "history" / code / f"{date}.html", HistoryStatus.SNAPSHOT))
+
+    result = hc.crawl('<div id="se:1"></div>')
+    assert list(result.index) == ["se:1", "se:2", "se:3"]
+    assert len(threads) > 1
+
+def test_snapshot_extracts_identical_bodies_once(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(HistoryCrawler, "_cached_fetch", lambda self, url: '<div id="se:4">Same</div>')
+    hc = HistoryCrawler(tmp_path, HistoryOptions(base_url=""))
+    calls = []
+    original = hc._extract_fragment_html
+    monkeypatch.setattr(hc, "_extract_fragment_html", lambda html, code: calls.append(code) or original(html, code))
+
+    first = hc.snapshot("se:4", "20200101", "/x#20200101")
+    second = hc.snapshot("se:4", "20210101", "/x#20210101")
+    assert calls == ["se:4"]
+    assert first.path.read_text(encoding="utf-8") == second.path.read_text(encoding="utf-8") == '<div id="se:4">Same</div>'
+
+def test_enumerate_versions_scan_matches_parser(tmp_path: Path, monkeypatch):
+    page = """
+    <html><head>
+      <title><a href="/title#20030101">t</a></title>
+      <style>a[href="/styled#19990101"] { color: red }</style>
+      <script>var tpl = '<a href="/scripted#19980101">x</a>';</script>
+    </head><body>
+      <a class="x" href="/fr/version/rc/S-2.1?code=se:1&amp;historique=20200101#20200101">2020</a>
+      <!-- <a href="/commented#20100101">old</a> -->
+      <A HREF='/fr/version/rc/S-2.1?code=se:1#20240229'>2024</A>
+      <a href=/fr/version/rc/S-2.1?code=se:1#20250101>2025</a>
+      <a title="v > 1" href="/fr/version/rc/S-2.1?code=se:1#20260101">2026</a>
+      <textarea><a href="/textarea#20010101">t</a></textarea>
+      <xmp><a href="/xmp#20020101">x</a></xmp>
+      <a data-href="/ignored#20990101" href="/menu">menu</a>
+      <abbr title="/x#20110101">abbr</abbr>
+    </body></html>
+    """
+    monkeypatch.setattr(HistoryCrawler, "_cached_fetch", lambda self, url: page)
+    fast = HistoryCrawler(tmp_path, HistoryOptions(base_url="")).enumerate_versions("/whatever")
+    strict = HistoryCrawler(tmp_path, HistoryOptions(base_url="", strict_versions=True)).enumerate_versions("/whatever")
+    assert fast == strict
+    assert [i["href"] for i in fast] == [
+        "/fr/version/rc/S-2.1?code=se:1&historique=20200101#20200101",
+        "/fr/version/rc/S-2.1?code=se:1#20240229",
+        "/fr/version/rc/S-2.1?code=se:1#20250101",
+        "/fr/version/rc/S-2.1?code=se:1#20260101",
+    ]
@@ -0,0 +1,16 @@
+from lrn.net import build_session, non_utf8_charset
+
+
+def test_build_session_mounts_pooled_adapter():
+    session = build_session("LRN/Test", pool_maxsize=24)
+    adapter = session.get_adapter("https://www.legisquebec.gouv.qc.ca/")
+    assert adapter._pool_maxsize == 24
+    assert adapter.max_retries.total == 3
+    assert session.headers["User-Agent"] == "LRN/Test"
+
+
+def test_non_utf8_charset():
+    assert non_utf8_charset("text/html; charset=ISO-8859-1") == "ISO-8859-1"
+    assert non_utf8_charset('text/html; charset="utf-8"') is None
+    assert non_utf8_charset("text/html") is None
+    assert non_utf8_charset(None) is None